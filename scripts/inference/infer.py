@@ -1,8 +1,11 @@
 import argparse
 import time
+from mpi4py import MPI
 from sunbird.inference import Nested
 
 if __name__ == "__main__":
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--config_path", type=str, default="configs/infer_combined.yaml"
@@ -10,6 +13,8 @@ if __name__ == "__main__":
     args = parser.parse_args()
     nested = Nested.from_config(args.config_path)
     t0 = time.time()
-    print(f"Fitting parameters {nested.param_names}")
-    nested()
-    print("Fitting took = ", time.time() - t0)
+    if rank == 0:
+        print(f"Fitting parameters {nested.param_names}")
+    nested(use_mpi=comm.Get_size() > 1)
+    if rank == 0:
+        print("Fitting took = ", time.time() - t0)
@@ -2,9 +2,12 @@ import argparse
 import yaml
 import time
 from pathlib import Path
+from mpi4py import MPI
 from sunbird.inference import Nested
 
 if __name__ == "__main__":
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
     output_path = Path("/n/home11/ccuestalazaro/sunbird/scripts/inference/chains/")
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -20,12 +23,15 @@ if __name__ == "__main__":
     config["data"]["observation"]["get_obs_args"]["hod_idx"] = args.hod_idx
     dir_store = f"beyond2pt_abacus_cosmo{args.cosmology}_hod{args.hod_idx}"
     config["inference"]["output_dir"] = output_path / dir_store
-    print("output dir")
-    print(config["inference"]["output_dir"])
+    if rank == 0:
+        print("output dir")
+        print(config["inference"]["output_dir"])
     nested = Nested.from_config_dict(
         config=config,
     )
     t0 = time.time()
-    print(f"Fitting parameters {nested.param_names}")
-    nested()
-    print("Fitting took = ", time.time() - t0)
+    if rank == 0:
+        print(f"Fitting parameters {nested.param_names}")
+    nested(use_mpi=comm.Get_size() > 1)
+    if rank == 0:
+        print("Fitting took = ", time.time() - t0)
@@ -143,7 +143,10 @@ class Transforms:
         Returns:
             xr.DataArray: transformed summary
         """
-        summary = summary.copy()
+        if type(summary) is torch.Tensor:
+            summary = summary.detach().clone()
+        else:
+            summary = summary.copy()
         for transform in self.transforms:
             summary = transform.transform(summary)
         return summary
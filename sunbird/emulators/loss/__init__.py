@@ -1,2 +1,2 @@
-from .gaussian import GaussianNLoglike
+from .gaussian import GaussianNLoglike, DiagonalGaussianNLoglike
 from .weighted import WeightedL1Loss, WeightedMSELoss
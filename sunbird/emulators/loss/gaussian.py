@@ -14,7 +14,7 @@ class GaussianNLoglike(nn.Module):
         """
         super().__init__()
         self.covariance = covariance
-        self.inverse_covariance = torch.linalg.inv(self.covariance)
+        self.cholesky_factor = torch.linalg.cholesky(self.covariance)
         self.n_bins = self.covariance.shape[0]
 
     @classmethod
@@ -62,6 +62,37 @@ class GaussianNLoglike(nn.Module):
         """
         diff = predictions - targets
         # TODO: this shouldn't be necessary, buffer has been defined?
-        self.inverse_covariance = self.inverse_covariance.to(diff.device)
-        right = torch.einsum("ij,kj->ki", self.inverse_covariance, diff)
-        return 0.5 * (torch.einsum("...j,...j", diff, right)).mean() / self.n_bins
+        self.cholesky_factor = self.cholesky_factor.to(diff.device)
+        z = torch.linalg.solve_triangular(self.cholesky_factor, diff.T, upper=False)
+        return 0.5 * torch.einsum("ib,ib->b", z, z).mean() / self.n_bins
+
+
+class DiagonalGaussianNLoglike(GaussianNLoglike):
+    def __init__(self, covariance: Tensor):
+        """Class to compute the negative Gaussian log-likelihood given a diagonal covariance matrix,
+        only the variances along the diagonal are used
+
+        Args:
+            covariance (Tensor): covariance matrix
+        """
+        # skip GaussianNLoglike.__init__, the cholesky factor of the full matrix is not needed
+        nn.Module.__init__(self)
+        self.covariance = covariance
+        self.n_bins = self.covariance.shape[0]
+        self.inverse_variance = 1.0 / torch.diagonal(self.covariance)
+
+    def __call__(self, predictions: Tensor, targets: Tensor) -> float:
+        """Given a set of inputs and targets, estimate the negative log-likelihood of the predicted values
+
+        Args:
+            predictions (Tensor): model predictions
+            targets (Tensor): target values
+
+        Returns:
+            float: log-likelihood of the predicitons
+        """
+        diff = predictions - targets
+        self.inverse_variance = self.inverse_variance.to(diff.device)
+        return (
+            0.5 * ((diff * diff) * self.inverse_variance).sum(-1).mean() / self.n_bins
+        )
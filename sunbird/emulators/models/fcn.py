@@ -5,7 +5,12 @@ import torch
 
 from sunbird.emulators.models import BaseModel
 from sunbird.covariance import CovarianceMatrix
-from sunbird.emulators.loss import GaussianNLoglike, WeightedL1Loss, WeightedMSELoss
+from sunbird.emulators.loss import (
+    GaussianNLoglike,
+    DiagonalGaussianNLoglike,
+    WeightedL1Loss,
+    WeightedMSELoss,
+)
 
 
 class ResNet(torch.nn.Module):
@@ -142,7 +147,7 @@ class FCN(BaseModel):
         Args:
             loss (str): loss to load
         """
-        if loss == "gaussian" or "weighted" in loss:
+        if loss in ("gaussian", "diagonal_gaussian") or "weighted" in loss:
             covariance = CovarianceMatrix(
                 statistics=[kwargs["statistic"]],
                 slice_filters=kwargs.get("slice_filters", None),
@@ -159,6 +164,10 @@ class FCN(BaseModel):
                 self.loss_fct = GaussianNLoglike(
                     covariance=covariance,
                 )
+            elif loss == "diagonal_gaussian":
+                self.loss_fct = DiagonalGaussianNLoglike(
+                    covariance=covariance,
+                )
             elif loss == "weighted_mae":
                 self.loss_fct = WeightedL1Loss(
                     variance=torch.sqrt(torch.diagonal(covariance))
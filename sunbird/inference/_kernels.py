@@ -0,0 +1,44 @@
+import numpy as np
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+
+        return decorator
+
+
+@njit(cache=True, fastmath=True)
+def gaussian_loglikelihood(
+    prediction: np.array,
+    whitened_observation: np.array,
+    cholesky_factor: np.array,
+) -> float:
+    """Gaussian loglikelihood of a prediction, fusing the forward substitution with the
+    lower cholesky factor of the covariance, the residual with respect to the whitened
+    observation and the reduction into a single loop
+
+    Args:
+        prediction (np.array): model prediction
+        whitened_observation (np.array): observed data, whitened by the cholesky factor
+        cholesky_factor (np.array): lower triangular cholesky factor of the covariance
+
+    Returns:
+        float: log likelihood
+    """
+    n = prediction.shape[0]
+    z = np.empty(n)
+    acc = 0.0
+    for i in range(n):
+        s = prediction[i]
+        for j in range(i):
+            s -= cholesky_factor[i, j] * z[j]
+        z[i] = s / cholesky_factor[i, i]
+        acc += (z[i] - whitened_observation[i]) ** 2
+    return -0.5 * acc
@@ -1,12 +1,35 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
+import functools
+import hashlib
 import importlib
+import json
+import os
+import sys
 import numpy as np
+import torch
 import yaml
+from scipy.linalg.lapack import dpotrf, dtrtrs
 from typing import Dict, List, Tuple, Optional
 from sunbird.covariance import CovarianceMatrix
 from sunbird.data import data_readers
 from sunbird.summaries import Bundle
+from sunbird.inference._kernels import NUMBA_AVAILABLE, gaussian_loglikelihood
+
+# Largest predicted variance, relative to the smallest covariance eigenvalue, for which
+# the predicted uncertainty is treated as a diagonal perturbation in the eigenbasis
+PREDICTED_UNCERTAINTY_RTOL = 1.0e-3
+
+
+def _is_main_process() -> bool:
+    """Whether this is the first MPI rank, or the only process if mpi4py is not in use"""
+    mpi = sys.modules.get("mpi4py.MPI")
+    return mpi is None or mpi.COMM_WORLD.Get_rank() == 0
+
+
+@functools.lru_cache(maxsize=None)
+def _get_distributions_module(name: str):
+    return importlib.import_module(name)
 
 
 class Inference(ABC):
@@ -22,6 +45,7 @@ class Inference(ABC):
         output_dir: Path,
         add_predicted_uncertainty: bool = False,
         device: str = "cpu",
+        cholesky_factor: Optional[np.array] = None,
     ):
         """Given an inference algorithm, a theory model, and a dataset, get posteriors on the
         parameters of interest. It assumes a gaussian likelihood.
@@ -36,20 +60,55 @@ class Inference(ABC):
             slice_filters (Dict, optional): filters to slice values in coordinates. Defaults to None.
             output_dir (Path): directory where results will be stored
             device (str, optional): gpu or cpu. Defaults to "cpu".
+            cholesky_factor (np.array, optional): precomputed lower cholesky factor of the covariance
+            matrix. If given, covariance_matrix can be None. Defaults to None.
         """
         self.theory_model = theory_model
         self.observation = observation
+        if covariance_matrix is None:
+            covariance_matrix = cholesky_factor @ cholesky_factor.T
         self.covariance_matrix = covariance_matrix
+        self.residual_buffer = np.empty(len(self.observation))
         self.add_predicted_uncertainty = add_predicted_uncertainty
-        if not self.add_predicted_uncertainty:
-            self.inverse_covariance_matrix = self.invert_covariance(
-                covariance_matrix=self.covariance_matrix,
+        self.diagonal_covariance = not np.any(
+            self.covariance_matrix - np.diag(np.diagonal(self.covariance_matrix))
+        )
+        if self.diagonal_covariance:
+            self.covariance_diagonal = np.diagonal(self.covariance_matrix).copy()
+            self.inverse_covariance_diagonal = 1.0 / self.covariance_diagonal
+        elif not self.add_predicted_uncertainty:
+            if cholesky_factor is None:
+                cholesky_factor = self.get_cholesky_factor(
+                    covariance_matrix=self.covariance_matrix,
+                )
+            self.cholesky_factor = cholesky_factor
+            self.whitened_observation, _ = dtrtrs(
+                self.cholesky_factor, self.observation, lower=1
             )
+        else:
+            (
+                self.covariance_eigenvalues,
+                self.covariance_eigenvectors,
+            ) = np.linalg.eigh(self.covariance_matrix)
         self.priors = priors
         self.n_dim = len(self.priors)
         self.fixed_parameters = fixed_parameters
         self.device = device
         self.param_names = list(self.priors.keys())
+        missing_parameters = [
+            param
+            for param in self.theory_model.input_names
+            if param not in self.priors and param not in self.fixed_parameters
+        ]
+        if missing_parameters:
+            raise ValueError(
+                f"Parameters {missing_parameters} of the theory model have neither a prior "
+                "nor a fixed value"
+            )
+        self.varied_parameter_indices = [
+            self.theory_model.input_names.index(param) for param in self.param_names
+        ]
+        self.parameter_buffer = None
         self.select_filters = select_filters
         self.slice_filters = slice_filters
         self.output_dir = Path(output_dir)
@@ -108,20 +167,34 @@ class Inference(ABC):
                 )
             else:
                 covariance_config["volume_scaling"] = 1.0
+        cholesky_factor = None
+        if covariance_config.get("cache_dir") is not None:
+            cache_file = Path(covariance_config["cache_dir"]) / (
+                cls.get_covariance_cache_key(config) + "_chol.npy"
+            )
+            if cache_file.exists():
+                cholesky_factor = np.load(cache_file)
         theory_model = cls.get_theory_model(
-            config["theory_model"], statistics=config["statistics"]
-        )
-        covariance_matrix = cls.get_covariance_matrix(
-            covariance_data_class=covariance_config["class"],
-            covariance_dataset=covariance_config["dataset"],
-            add_emulator_error=covariance_config["add_emulator_error_test_set"],
-            add_simulation_error=covariance_config["add_simulation_error"],
-            volume_scaling=covariance_config["volume_scaling"],
-            statistics=config["statistics"],
-            select_filters=select_filters,
-            slice_filters=slice_filters,
-            theory_model=theory_model,
+            config["theory_model"], statistics=config["statistics"], device=device
         )
+        if cholesky_factor is None:
+            covariance_matrix = cls.get_covariance_matrix(
+                covariance_data_class=covariance_config["class"],
+                covariance_dataset=covariance_config["dataset"],
+                add_emulator_error=covariance_config["add_emulator_error_test_set"],
+                add_simulation_error=covariance_config["add_simulation_error"],
+                volume_scaling=covariance_config["volume_scaling"],
+                statistics=config["statistics"],
+                select_filters=select_filters,
+                slice_filters=slice_filters,
+                theory_model=theory_model,
+            )
+            if covariance_config.get("cache_dir") is not None:
+                cholesky_factor = cls.get_cholesky_factor(covariance_matrix)
+                if _is_main_process():
+                    cls.save_cholesky_factor(cholesky_factor, cache_file)
+        else:
+            covariance_matrix = None
         parameters_to_fit = [
             p for p in theory_model.input_names if p not in fixed_parameters.keys()
         ]
@@ -137,8 +210,50 @@ class Inference(ABC):
             output_dir=config["inference"]["output_dir"],
             add_predicted_uncertainty=covariance_config["add_predicted_uncertainty"],
             device=device,
+            cholesky_factor=cholesky_factor,
         )
 
+    @classmethod
+    def save_cholesky_factor(cls, cholesky_factor: np.array, cache_file: Path):
+        """Save the cholesky factor of the covariance to the cache. It is written to a
+        temporary file first and moved into place, so that other processes never read a
+        partially written cache file
+
+        Args:
+            cholesky_factor (np.array): lower triangular cholesky factor of the covariance
+            cache_file (Path): path to the cache file
+        """
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            np.save(f, cholesky_factor)
+        os.replace(tmp_file, cache_file)
+
+    @classmethod
+    def get_covariance_cache_key(cls, config: Dict) -> str:
+        """Get a key that identifies the covariance matrix produced by a configuration, used
+        to cache its cholesky factor on disk
+
+        Args:
+            config (Dict): dictionary with configuration
+
+        Returns:
+            str: hash of the parts of the configuration the covariance matrix depends on
+        """
+        covariance_config = {
+            k: v for k, v in config["data"]["covariance"].items() if k != "cache_dir"
+        }
+        key_config = {
+            "covariance": covariance_config,
+            "statistics": config["statistics"],
+            "select_filters": config["select_filters"],
+            "slice_filters": config["slice_filters"],
+            "theory_model": config["theory_model"],
+        }
+        return hashlib.sha1(
+            json.dumps(key_config, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
     @classmethod
     def get_observation_and_parameters(
         cls,
@@ -241,7 +356,7 @@ class Inference(ABC):
         Returns:
             Dict: dictionary with initialized priors
         """
-        distributions_module = importlib.import_module(prior_config.pop("stats_module"))
+        distributions_module = _get_distributions_module(prior_config["stats_module"])
         prior_dict = {}
         for param in parameters_to_fit:
             config_for_param = prior_config[param]
@@ -263,6 +378,7 @@ class Inference(ABC):
         Returns:
             prior distirbution
         """
+        dist_param = dict(dist_param)
         if dist_param["distribution"] == "uniform":
             max_uniform = dist_param.pop("max")
             min_uniform = dist_param.pop("min")
@@ -281,26 +397,41 @@ class Inference(ABC):
         cls,
         theory_config: Dict,
         statistics: List[str],
+        device: str = "cpu",
     ) -> "Summary":
         """Get theory model
 
         Args:
-            theory_config (Dict): configuration for theory model, both module and class
+            theory_config (Dict): configuration for theory model, both module and class. An optional
+            dtype entry (e.g. "bfloat16") sets the precision of the emulator on gpu, where the
+            emulator is also compiled with torch.compile.
+            statistics (List[str]): list of statistics to predict
+            device (str, optional): device where the emulator is evaluated. Defaults to "cpu".
 
         Returns:
             Summary: summary to fit
         """
-        module = theory_config.pop("module")
-        class_name = theory_config.pop("class")
+        module = theory_config["module"]
+        class_name = theory_config["class"]
+        dtype = theory_config.get("dtype", None)
         if "args" in theory_config:
-            return getattr(importlib.import_module(module), class_name)(
+            theory_model = getattr(importlib.import_module(module), class_name)(
                 summaries=statistics,
                 **theory_config.get("args", None),
             )
         else:
-            return getattr(importlib.import_module(module), class_name)(
+            theory_model = getattr(importlib.import_module(module), class_name)(
                 summaries=statistics,
             )
+        if not device.startswith("cuda"):
+            return theory_model.to(device=device)
+        if dtype is not None:
+            theory_model = theory_model.to(device=device, dtype=getattr(torch, dtype))
+        else:
+            theory_model = theory_model.to(device=device)
+        if hasattr(torch, "compile"):
+            theory_model = theory_model.compile()
+        return theory_model
 
     @abstractmethod
     def __call__(
@@ -308,63 +439,165 @@ class Inference(ABC):
     ):
         pass
 
-    def invert_covariance(
-        self,
+    @classmethod
+    def get_cholesky_factor(
+        cls,
         covariance_matrix: np.array,
     ) -> np.array:
-        """invert covariance matrix
+        """Get the lower triangular cholesky factor L of the covariance matrix,
+        such that C = L L^T
 
         Args:
-            covariance_matrix (np.array): covariance matrix to invert
+            covariance_matrix (np.array): covariance matrix to factorize
 
         Returns:
-            np.array: inverse covariance
+            np.array: lower triangular cholesky factor
+        """
+        cholesky_factor, info = dpotrf(covariance_matrix, lower=1, clean=1)
+        if info != 0:
+            raise np.linalg.LinAlgError("Covariance matrix is not positive definite")
+        return cholesky_factor
+
+    def rescale_covariance(self, factor: float):
+        """Rescale the covariance matrix, C -> factor * C, without refactorizing it, since
+        sqrt(factor) * L is the cholesky factor of factor * C. Useful for sensitivity sweeps over
+        the volume of the data. Note that volume_scaling only divides the covariance of the data,
+        so a change in volume_scaling corresponds to factor = old_volume_scaling / new_volume_scaling
+        only if no emulator or simulation errors were added to the covariance.
+
+        Args:
+            factor (float): factor by which the covariance matrix is multiplied
         """
-        return np.linalg.inv(covariance_matrix)
+        self.covariance_matrix = factor * self.covariance_matrix
+        if self.diagonal_covariance:
+            self.covariance_diagonal = factor * self.covariance_diagonal
+            self.inverse_covariance_diagonal = self.inverse_covariance_diagonal / factor
+        elif not self.add_predicted_uncertainty:
+            self.cholesky_factor = np.sqrt(factor) * self.cholesky_factor
+            self.whitened_observation = self.whitened_observation / np.sqrt(factor)
+        else:
+            self.covariance_eigenvalues = factor * self.covariance_eigenvalues
+
+    def get_loglikelihood_with_predicted_uncertainty(
+        self,
+        diff: np.array,
+        predicted_uncertainty: np.array,
+    ) -> np.array:
+        """Get gaussian loglikelihood for residuals whose covariance is augmented by the
+        predicted uncertainty of the model. If the predicted variance is small compared to
+        the covariance, it is treated as a diagonal perturbation in the eigenbasis of the
+        covariance, otherwise the augmented covariance is factorized exactly. Diagonal
+        covariances stay diagonal, so their loglikelihood is always exact.
+
+        Args:
+            diff (np.array): residuals between prediction and observation, in batches
+            predicted_uncertainty (np.array): predicted uncertainty, in batches
+
+        Returns:
+            np.array: array of likelihoods
+        """
+        if predicted_uncertainty is None:
+            raise ValueError(
+                "predicted_uncertainty must be given when add_predicted_uncertainty is True"
+            )
+        predicted_variance = np.atleast_2d(predicted_uncertainty) ** 2
+        if self.diagonal_covariance:
+            return -0.5 * np.sum(
+                diff**2 / (self.covariance_diagonal + predicted_variance), axis=-1
+            )
+        # the path is chosen per sample, so that a sample gets the same loglikelihood
+        # whether it is evaluated on its own or as part of a batch
+        eigenbasis = (
+            np.max(predicted_variance, axis=-1)
+            <= PREDICTED_UNCERTAINTY_RTOL * self.covariance_eigenvalues[0]
+        )
+        loglikelihood = np.empty(len(diff))
+        if np.any(eigenbasis):
+            diff_eigenbasis = diff[eigenbasis] @ self.covariance_eigenvectors
+            eigenvalues = (
+                self.covariance_eigenvalues
+                + predicted_variance[eigenbasis] @ self.covariance_eigenvectors**2
+            )
+            loglikelihood[eigenbasis] = -0.5 * np.sum(
+                diff_eigenbasis**2 / eigenvalues, axis=-1
+            )
+        covariance_matrix = self.covariance_matrix.copy()
+        covariance_diagonal = np.diagonal(self.covariance_matrix)
+        for i in np.flatnonzero(~eigenbasis):
+            np.fill_diagonal(
+                covariance_matrix, covariance_diagonal + predicted_variance[i]
+            )
+            cholesky_factor = self.get_cholesky_factor(covariance_matrix)
+            z, _ = dtrtrs(cholesky_factor, diff[i], lower=1)
+            loglikelihood[i] = -0.5 * z @ z
+        return loglikelihood
 
     def get_loglikelihood_for_prediction(
         self,
         prediction: np.array,
-        predicted_uncertainty: np.array,
+        predicted_uncertainty: Optional[np.array] = None,
     ) -> float:
-        """Get gaussian loglikelihood for prediction
+        """Get gaussian loglikelihood for prediction. Residuals are written into a buffer
+        that is reused across calls, so this method is not thread safe.
 
         Args:
             prediction (np.array): model prediction
+            predicted_uncertainty (np.array, optional): uncertainty of the model prediction, only
+            needed if add_predicted_uncertainty is True. Defaults to None.
 
         Returns:
             float: log likelihood
         """
-        diff = prediction - self.observation
-        if not self.add_predicted_uncertainty:
-            return -0.5 * diff @ self.inverse_covariance_matrix @ diff
-        covariance_matrix = self.covariance_matrix + np.diag(predicted_uncertainty**2)
-        inverse_covariance_matrix = self.invert_covariance(covariance_matrix)
-        return -0.5 * diff @ inverse_covariance_matrix @ diff
+        # emulators return torch/jax arrays, which the numba kernel cannot type
+        prediction = np.asarray(prediction, dtype=np.float64)
+        if self.add_predicted_uncertainty:
+            diff = np.subtract(prediction, self.observation, out=self.residual_buffer)
+            return self.get_loglikelihood_with_predicted_uncertainty(
+                diff.reshape(1, -1), predicted_uncertainty
+            )[0]
+        if self.diagonal_covariance:
+            diff = np.subtract(prediction, self.observation, out=self.residual_buffer)
+            np.multiply(diff, diff, out=diff)
+            return -0.5 * diff @ self.inverse_covariance_diagonal
+        if NUMBA_AVAILABLE:
+            return gaussian_loglikelihood(
+                prediction, self.whitened_observation, self.cholesky_factor
+            )
+        np.copyto(self.residual_buffer, prediction)
+        z, _ = dtrtrs(
+            self.cholesky_factor, self.residual_buffer, lower=1, overwrite_b=1
+        )
+        z -= self.whitened_observation
+        return -0.5 * z @ z
 
     def get_loglikelihood_for_prediction_vectorized(
         self,
         prediction: np.array,
-        predicted_uncertainty: np.array,
+        predicted_uncertainty: Optional[np.array] = None,
     ) -> np.array:
         """Get vectorized loglikelihood prediction
 
         Args:
             prediction (np.array): prediciton in batches
+            predicted_uncertainty (np.array, optional): uncertainty of the model prediction in batches,
+            only needed if add_predicted_uncertainty is True. Defaults to None.
 
         Returns:
             np.array: array of likelihoods
         """
-        diff = prediction - self.observation
-        if not self.add_predicted_uncertainty:
-            right = np.einsum("ik,...k", self.inverse_covariance_matrix, diff)
-            return -0.5 * np.einsum("ki,ji", diff, right)[:, 0]
-        covariance_matrix = self.covariance_matrix + np.diag(predicted_uncertainty**2)
-        inverse_covariance_matrix = self.invert_covariance(covariance_matrix)
-        right = np.einsum("ik,...k", inverse_covariance_matrix, diff)
-        return -0.5 * np.einsum("ki,ji", diff, right)[:, 0]
-
-
+        prediction = np.asarray(prediction, dtype=np.float64)
+        if self.add_predicted_uncertainty:
+            return self.get_loglikelihood_with_predicted_uncertainty(
+                prediction - self.observation, predicted_uncertainty
+            )
+        if self.diagonal_covariance:
+            diff = prediction - self.observation
+            return -0.5 * np.sum(
+                self.inverse_covariance_diagonal * diff * diff, axis=-1
+            )
+        z, _ = dtrtrs(self.cholesky_factor, prediction.T, lower=1)
+        z -= self.whitened_observation[:, None]
+        return -0.5 * np.einsum("ib,ib->b", z, z)
 
     def sample_parameters_from_prior(
         self,
@@ -389,6 +622,42 @@ class Inference(ABC):
             params, select_filters=self.select_filters, slice_filters=self.slice_filters
         )
 
+    def sample_parameters_from_prior_vectorized(
+        self,
+        n_samples: int,
+    ) -> Dict[str, np.array]:
+        """Sample a batch of parameters from the prior, with a single call to each distribution
+
+        Args:
+            n_samples (int): number of samples
+
+        Returns:
+            Dict[str, np.array]: dictionary with an array of samples for each parameter
+        """
+        params = {}
+        for param, dist in self.priors.items():
+            params[param] = dist.rvs(size=n_samples)
+        for p, v in self.fixed_parameters.items():
+            params[p] = np.full(n_samples, v)
+        return params
+
+    def sample_from_prior_vectorized(
+        self,
+        n_samples: int,
+    ) -> Tuple:
+        """Sample a batch of predictions from prior
+
+        Args:
+            n_samples (int): number of samples
+
+        Returns:
+            Tuple: tuple of parameters and theory model predictions in batches
+        """
+        params = self.sample_parameters_from_prior_vectorized(n_samples)
+        return params, self.get_model_prediction_vectorized(
+            np.stack([params[p] for p in self.param_names], axis=-1)
+        )
+
     def get_model_prediction(
         self,
         parameters: np.array,
@@ -401,36 +670,75 @@ class Inference(ABC):
         Returns:
             np.array: model prediction
         """
-        params = dict(zip(list(self.priors.keys()), parameters))
-        for i, fixed_param in enumerate(self.fixed_parameters.keys()):
-            params[fixed_param] = self.fixed_parameters[fixed_param]
+        params = self.fixed_parameters.copy()
+        params.update(zip(self.param_names, parameters))
         return self.theory_model(
             params,
             select_filters=self.select_filters,
             slice_filters=self.slice_filters,
         )
 
+    def get_parameter_buffer(self, batch_size: int) -> np.array:
+        """Get a reusable buffer of input parameters for the theory model, with one column per
+        input in theory_model.input_names. Fixed parameters are broadcast into the buffer only
+        when it is (re)allocated, which happens if the batch does not fit. The buffer lives on
+        the host, since the input transforms of the theory model operate on numpy arrays.
+
+        Args:
+            batch_size (int): number of samples in the batch
+
+        Returns:
+            np.array: view of the buffer with batch_size rows
+        """
+        if self.parameter_buffer is None or len(self.parameter_buffer) < batch_size:
+            input_names = self.theory_model.input_names
+            self.parameter_buffer = np.empty((batch_size, len(input_names)))
+            for fixed_param, value in self.fixed_parameters.items():
+                if fixed_param in input_names:
+                    self.parameter_buffer[:, input_names.index(fixed_param)] = value
+        return self.parameter_buffer[:batch_size]
+
     def get_model_prediction_vectorized(
         self,
         parameters: np.array,
-    ) -> np.array:
+    ) -> Tuple[np.array]:
         """get vectorized model predictions
 
         Args:
             parameters (np.array): input parameters
 
         Returns:
-            np.array: model predictions in batches
+            Tuple[np.array]: model predictions and predicted uncertainties in batches
         """
-        params = {}
-        for i, param in enumerate(self.priors.keys()):
-            params[param] = parameters[:, i]
-        for i, fixed_param in enumerate(self.fixed_parameters.keys()):
-            params[fixed_param] = self.fixed_parameters[fixed_param] * np.ones(
-                len(parameters)
-            )
-        out = self.theory_model.get_for_batch(
-            params,
-            s_min=self.s_min,
+        inputs = self.get_parameter_buffer(len(parameters))
+        inputs[:, self.varied_parameter_indices] = parameters
+        prediction, predicted_uncertainty = self.theory_model.get_for_batch_inputs(
+            inputs,
+            select_filters=self.select_filters,
+            slice_filters=self.slice_filters,
+        )
+        return (
+            prediction.reshape((len(parameters), -1)),
+            predicted_uncertainty.reshape((len(parameters), -1)),
+        )
+
+    def get_loglikelihood_for_batch(
+        self,
+        parameters: np.array,
+    ) -> np.array:
+        """Get gaussian loglikelihood for a batch of input parameters, with a single batched
+        forward pass of the theory model followed by the vectorized likelihood. The theory
+        models return their predictions on the host, so the likelihood is evaluated there.
+
+        Args:
+            parameters (np.array): input parameters in batches
+
+        Returns:
+            np.array: array of likelihoods
+        """
+        prediction, predicted_uncertainty = self.get_model_prediction_vectorized(
+            parameters
+        )
+        return self.get_loglikelihood_for_prediction_vectorized(
+            prediction, predicted_uncertainty
         )
-        return out.reshape((len(parameters), -1))
@@ -1,9 +1,22 @@
-from typing import Dict
+from typing import Dict, List, Optional
 import numpy as np
 import pandas as pd
 from dynesty import NestedSampler
 from sunbird.inference import Inference
 
+# Nested instance of the current MPI rank. Each rank builds its own, so that the pool
+# only needs to send parameter vectors instead of pickling the whole object (and the
+# theory model with it) on every likelihood call
+_nested = None
+
+
+def _get_loglikelihood_for_params(params: np.array) -> float:
+    return _nested.get_loglikelihood_for_params(params)
+
+
+def _get_prior_from_cube(cube: np.array) -> np.array:
+    return _nested.get_prior_from_cube(cube)
+
 
 class Nested(Inference):
     """Run nested sampling using dynesty"""
@@ -19,9 +32,28 @@ class Nested(Inference):
         """
         transformed_cube = np.array(cube)
         for n, param in enumerate(self.param_names):
-            transformed_cube[n] = self.priors[param].ppf(cube[n])
+            transformed_cube[..., n] = self.priors[param].ppf(cube[..., n])
         return transformed_cube
 
+    def get_initial_live_points(
+        self, num_live_points: int, rstate: np.random.Generator
+    ) -> List[np.array]:
+        """Draw the initial live points from the prior, evaluating their loglikelihood
+        in a single batch
+
+        Args:
+            num_live_points (int): number of live points
+            rstate (np.random.Generator): random generator used to draw the points
+
+        Returns:
+            List[np.array]: live points in the unit cube, in parameter space and their
+            loglikelihoods
+        """
+        live_cube = rstate.random((num_live_points, self.n_dim))
+        live_params = self.get_prior_from_cube(live_cube)
+        live_loglikelihood = self.get_loglikelihood_for_batch(live_params)
+        return [live_cube, live_params, live_loglikelihood]
+
     def get_loglikelihood_for_params(self, params: np.array) -> float:
         """Get loglikelihood for a set of parameters
 
@@ -43,6 +75,8 @@ class Nested(Inference):
         dlogz: float = 0.01,
         max_iterations: int = 50_000,
         max_calls: int = 1_000_000,
+        use_mpi: bool = False,
+        rstate: Optional[np.random.Generator] = None,
     ):
         """Run nested sampling
 
@@ -51,13 +85,79 @@ class Nested(Inference):
             dlogz (float, optional): allowed error on evidence. Defaults to 0.01.
             max_iterations (int, optional): maximum number of iterations. Defaults to 50_000.
             max_calls (int, optional): maximum number of calls. Defaults to 1_000_000.
+            use_mpi (bool, optional): whether to distribute likelihood evaluations across MPI ranks.
+            Only the master rank runs the sampler and stores the results. Defaults to False.
+            rstate (np.random.Generator, optional): random generator shared by the initial
+            live points and dynesty, set it for reproducible runs. Defaults to None.
+        """
+        if use_mpi:
+            from schwimmbad import MPIPool
+
+            global _nested
+            _nested = self
+            with MPIPool() as pool:
+                if not pool.is_master():
+                    pool.wait()
+                    return
+                self.run_sampler(
+                    num_live_points=num_live_points,
+                    dlogz=dlogz,
+                    max_iterations=max_iterations,
+                    max_calls=max_calls,
+                    pool=pool,
+                    rstate=rstate,
+                )
+        else:
+            self.run_sampler(
+                num_live_points=num_live_points,
+                dlogz=dlogz,
+                max_iterations=max_iterations,
+                max_calls=max_calls,
+                rstate=rstate,
+            )
+
+    def run_sampler(
+        self,
+        num_live_points: int,
+        dlogz: float,
+        max_iterations: int,
+        max_calls: int,
+        pool=None,
+        rstate: Optional[np.random.Generator] = None,
+    ):
+        """Run dynesty and store its results
+
+        Args:
+            num_live_points (int): number of live points
+            dlogz (float): allowed error on evidence
+            max_iterations (int): maximum number of iterations
+            max_calls (int): maximum number of calls
+            pool (optional): pool used to evaluate the likelihood in parallel, every worker
+            must have set its own instance through __call__. Defaults to None.
+            rstate (np.random.Generator, optional): random generator. Defaults to None.
         """
+        if rstate is None:
+            rstate = np.random.default_rng()
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        if pool is not None:
+            loglikelihood, prior_transform = (
+                _get_loglikelihood_for_params,
+                _get_prior_from_cube,
+            )
+        else:
+            loglikelihood, prior_transform = (
+                self.get_loglikelihood_for_params,
+                self.get_prior_from_cube,
+            )
         sampler = NestedSampler(
-            self.get_loglikelihood_for_params,
-            self.get_prior_from_cube,
+            loglikelihood,
+            prior_transform,
             ndim=self.n_dim,
             nlive=num_live_points,
+            live_points=self.get_initial_live_points(num_live_points, rstate=rstate),
+            pool=pool,
+            queue_size=pool.size if pool is not None else None,
+            rstate=rstate,
         )
         sampler.run_nested(
             checkpoint_file=str(self.output_dir / "dynasty.save"),
@@ -24,18 +24,23 @@ class UltraNested(Inference):
         return params
 
     def get_loglikelihood_for_params(self, params):
-        prediction = self.get_model_prediction_vectorized(params)
-        loglike = self.get_loglikelihood_for_prediction_vectorized(
-            prediction=prediction
-        )
-        return np.atleast_1d(loglike)
+        return np.atleast_1d(self.get_loglikelihood_for_batch(params))
 
-    def __call__(self, log_dir, num_live_points, slice_steps=None):
+    def __call__(
+        self,
+        log_dir,
+        num_live_points,
+        slice_steps=None,
+        ndraw_min=128,
+        ndraw_max=65536,
+    ):
         sampler = ReactiveNestedSampler(
             self.param_names,
             self.get_loglikelihood_for_params,
             log_dir=log_dir,
             vectorized=True,
+            ndraw_min=ndraw_min,
+            ndraw_max=ndraw_max,
             transform=self.get_prior_from_cube,
         )
         if slice_steps is not None:
@@ -77,6 +77,49 @@ class BaseSummary:
         self.input_names = input_names
         self.coordinates = coordinates
         self.coordinates_shape = tuple(len(v) for k, v in coordinates.items())
+        self.device = "cpu"
+        self.dtype = torch.float32
+
+    def to(
+        self,
+        device: str = "cpu",
+        dtype: torch.dtype = torch.float32,
+    ) -> "BaseSummary":
+        """Move the torch model to a given device and set the precision of its forward pass.
+        Weights and inputs are kept in float32, so that parameters are not rounded, and the
+        forward pass runs under torch.autocast with the given precision. Predictions are
+        always returned as float32 on the cpu.
+
+        Args:
+            device (str, optional): device where the model is evaluated. Defaults to "cpu".
+            dtype (torch.dtype, optional): autocast precision of the forward pass, e.g.
+            torch.bfloat16. Defaults to torch.float32, which disables autocast.
+
+        Returns:
+            BaseSummary: summary
+        """
+        if not self.flax:
+            self.model = self.model.to(device=device)
+            self.device = device
+            self.dtype = dtype
+        return self
+
+    def compile(self, mode: Optional[str] = None) -> "BaseSummary":
+        """Compile the torch model with torch.compile, to reduce the python and kernel launch
+        overhead of repeated forward passes. The batch dimension is compiled as dynamic, since
+        the samplers call the model with batches of varying size.
+
+        Args:
+            mode (str, optional): torch.compile mode. Defaults to None, torch's default mode.
+            "reduce-overhead" records a cuda graph per batch size and is only worth it if
+            the batch size is fixed.
+
+        Returns:
+            BaseSummary: summary
+        """
+        if not self.flax:
+            self.model = torch.compile(self.model, mode=mode, dynamic=True)
+        return self
 
     @classmethod
     def from_folder(
@@ -215,10 +258,15 @@ class BaseSummary:
             prediction, variance = self.model_apply(self.flax_params, inputs)
             errors = jnp.sqrt(variance)
         else:
-            inputs = torch.tensor(inputs, dtype=torch.float32)
-            prediction, variance = self.model(inputs)
-            prediction = prediction.detach()
-            errors = torch.sqrt(variance).detach()
+            inputs = torch.as_tensor(inputs, dtype=torch.float32, device=self.device)
+            with torch.no_grad(), torch.autocast(
+                device_type=torch.device(self.device).type,
+                dtype=self.dtype,
+                enabled=self.dtype != torch.float32,
+            ):
+                prediction, variance = self.model(inputs)
+            prediction = prediction.detach().float().cpu()
+            errors = torch.sqrt(variance.detach().float()).cpu()
         if self.output_transforms is not None:
             prediction, errors = self.apply_output_transforms(
                 prediction, errors, batch=batch
@@ -2,6 +2,7 @@ from typing import List, Dict, Optional
 import numpy as np
 from pathlib import Path
 import jax.numpy as jnp
+import torch
 from sunbird.summaries.base import BaseSummary
 from sunbird.summaries import TPCF, DensitySplitAuto, DensitySplitCross, DensityPDF
 
@@ -62,6 +63,39 @@ class Bundle(BaseSummary):
             ),
         }
 
+    def to(
+        self,
+        device: str = "cpu",
+        dtype: torch.dtype = torch.float32,
+    ) -> "Bundle":
+        """Move the torch models of all summaries to a given device and set the precision of
+        their forward pass
+
+        Args:
+            device (str, optional): device where the models are evaluated. Defaults to "cpu".
+            dtype (torch.dtype, optional): autocast precision of the forward pass. Defaults to
+            torch.float32.
+
+        Returns:
+            Bundle: bundle of summaries
+        """
+        for summary in self.all_summaries.values():
+            summary.to(device=device, dtype=dtype)
+        return self
+
+    def compile(self, mode: Optional[str] = None) -> "Bundle":
+        """Compile the torch models of all summaries with torch.compile
+
+        Args:
+            mode (str, optional): torch.compile mode. Defaults to None, torch's default mode.
+
+        Returns:
+            Bundle: bundle of summaries
+        """
+        for summary in self.all_summaries.values():
+            summary.compile(mode=mode)
+        return self
+
     @property
     def input_names(
         self,
@@ -3,7 +3,12 @@ from scipy.stats import multivariate_normal
 import torch
 from torch import nn
 import numpy as np
-from sunbird.emulators.loss import GaussianNLoglike, WeightedL1Loss, WeightedMSELoss
+from sunbird.emulators.loss import (
+    GaussianNLoglike,
+    DiagonalGaussianNLoglike,
+    WeightedL1Loss,
+    WeightedMSELoss,
+)
 
 def test__gaussian():
     gl = GaussianNLoglike.from_statistics(
@@ -32,6 +37,24 @@ def test__gaussian_with_batch():
         loglike += gl(inputs[batch].reshape(1,-1), targets[batch].reshape(1,-1))
     assert gl(inputs, targets)  == pytest.approx(loglike/len(inputs))
 
+def test__diagonal_gaussian():
+    n_dim = 10
+    n_batch = 2
+    covariance = torch.diag(torch.tensor(np.random.random(size=n_dim) + 0.5, dtype=torch.float32))
+    inputs = torch.tensor(np.random.random(size=(n_batch, n_dim)), dtype=torch.float32)
+    targets = torch.tensor(np.random.random(size=(n_batch, n_dim)), dtype=torch.float32)
+    gl = GaussianNLoglike(covariance=covariance)
+    diagonal_gl = DiagonalGaussianNLoglike(covariance=covariance)
+    assert float(diagonal_gl(inputs, targets)) == pytest.approx(float(gl(inputs, targets)), rel=1.e-5)
+
+def test__diagonal_gaussian_ignores_off_diagonal():
+    covariance = torch.tensor([[1., 2.], [2., 1.]])
+    inputs = torch.tensor(np.random.random(size=(3, 2)), dtype=torch.float32)
+    targets = torch.tensor(np.random.random(size=(3, 2)), dtype=torch.float32)
+    diagonal_gl = DiagonalGaussianNLoglike(covariance=covariance)
+    expected = 0.5 * ((inputs - targets)**2).sum(-1).mean() / 2
+    assert float(diagonal_gl(inputs, targets)) == pytest.approx(float(expected), rel=1.e-5)
+
 def test__weighted_mse():
     n_dim = 10
     n_batch= 2
@@ -1,8 +1,401 @@
+import pickle
+
 import numpy as np
 import pytest
+import torch
+from scipy import stats
 
-from sunbird.inference import Nested
+import sunbird.inference.inference
+from sunbird.inference import Inference, Nested
 from sunbird.summaries import DensitySplitCross
+from sunbird.summaries.base import BaseSummary
+from sunbird.data.transforms import Transforms, Normalize
+
+
+class LinearEmulator(torch.nn.Module):
+    def __init__(self, n_input, n_output, uncertainty_scale=1.0):
+        super().__init__()
+        torch.manual_seed(0)
+        self.linear = torch.nn.Linear(n_input, n_output)
+        self.uncertainty_scale = uncertainty_scale
+
+    def forward(self, x):
+        prediction = self.linear(x)
+        return prediction, (self.uncertainty_scale * prediction) ** 2
+
+
+class FixedInference(Inference):
+    def __call__(self):
+        pass
+
+
+def get_summary(n_bins, uncertainty_scale=1.0):
+    return BaseSummary(
+        model=LinearEmulator(3, n_bins, uncertainty_scale=uncertainty_scale),
+        coordinates={"s": np.arange(n_bins)},
+        input_transforms=Transforms(
+            [Normalize(training_min=np.zeros(3), training_max=2.0 * np.ones(3))]
+        ),
+        input_names=["a", "b", "c"],
+    )
+
+
+def get_inference(
+    n_bins=20,
+    diagonal=False,
+    add_predicted_uncertainty=False,
+    uncertainty_scale=1.0,
+    covariance_scale=1.0,
+    inference_class=FixedInference,
+):
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=(n_bins, n_bins))
+    covariance = a @ a.T + n_bins * np.eye(n_bins)
+    if diagonal:
+        covariance = np.diag(np.diagonal(covariance))
+    return inference_class(
+        theory_model=get_summary(n_bins, uncertainty_scale=uncertainty_scale),
+        observation=rng.normal(size=n_bins),
+        covariance_matrix=covariance_scale * covariance,
+        priors={"a": stats.uniform(0.0, 1.0), "b": stats.uniform(0.0, 1.0)},
+        fixed_parameters={"c": 0.5},
+        select_filters=None,
+        slice_filters=None,
+        output_dir="chains",
+        add_predicted_uncertainty=add_predicted_uncertainty,
+    )
+
+
+def get_expected_loglikelihood(inference, prediction, predicted_uncertainty=None):
+    covariance = inference.covariance_matrix
+    if predicted_uncertainty is not None:
+        covariance = covariance + np.diag(predicted_uncertainty**2)
+    diff = prediction - inference.observation
+    return -0.5 * diff @ np.linalg.inv(covariance) @ diff
+
+
+def test_batch_loglikelihood_with_input_transforms():
+    inference = get_inference()
+    parameters = np.random.default_rng(1).random(size=(5, 2))
+    prediction, _ = inference.get_model_prediction_vectorized(parameters)
+    expected = [
+        get_expected_loglikelihood(inference, np.asarray(p, dtype=np.float64))
+        for p in prediction
+    ]
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_batch(parameters), expected, rtol=1.0e-6
+    )
+    prediction_from_dict, _ = inference.theory_model.get_for_batch(
+        {"a": parameters[:, 0], "b": parameters[:, 1], "c": 0.5 * np.ones(5)},
+        select_filters=None,
+        slice_filters=None,
+    )
+    np.testing.assert_allclose(prediction, prediction_from_dict, rtol=1.0e-6)
+
+
+def test_inference_requires_all_inputs():
+    with pytest.raises(ValueError, match="c"):
+        FixedInference(
+            theory_model=get_summary(20),
+            observation=np.zeros(20),
+            covariance_matrix=np.eye(20),
+            priors={"a": stats.uniform(0.0, 1.0), "b": stats.uniform(0.0, 1.0)},
+            fixed_parameters={},
+            select_filters=None,
+            slice_filters=None,
+            output_dir="chains",
+        )
+
+
+def test_batch_loglikelihood_with_predicted_uncertainty():
+    inference = get_inference(add_predicted_uncertainty=True)
+    parameters = np.random.default_rng(1).random(size=(5, 2))
+    prediction, predicted_uncertainty = inference.get_model_prediction_vectorized(
+        parameters
+    )
+    expected = [
+        get_expected_loglikelihood(
+            inference, np.asarray(p, dtype=np.float64), np.asarray(u, dtype=np.float64)
+        )
+        for p, u in zip(prediction, predicted_uncertainty)
+    ]
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_batch(parameters), expected, rtol=1.0e-6
+    )
+
+
+def test_summary_autocast_keeps_float32_weights():
+    summary = get_summary(5).to(device="cpu", dtype=torch.bfloat16)
+    assert next(summary.model.parameters()).dtype == torch.float32
+    inputs = np.random.default_rng(1).random(size=(4, 3))
+    prediction, _ = summary.get_for_batch_inputs(inputs, None, None)
+    expected, _ = get_summary(5).get_for_batch_inputs(inputs, None, None)
+    assert prediction.dtype == torch.float32
+    np.testing.assert_allclose(prediction, expected, atol=1.0e-1)
+
+
+def test_save_cholesky_factor(tmp_path):
+    cholesky_factor = np.linalg.cholesky(get_inference().covariance_matrix)
+    cache_file = tmp_path / "cache" / "key_chol.npy"
+    Inference.save_cholesky_factor(cholesky_factor, cache_file)
+    assert list(cache_file.parent.iterdir()) == [cache_file]
+    np.testing.assert_array_equal(np.load(cache_file), cholesky_factor)
+
+
+def test_initial_live_points_are_reproducible():
+    inference = get_inference(inference_class=Nested)
+    live_points = inference.get_initial_live_points(
+        10, rstate=np.random.default_rng(42)
+    )
+    same_live_points = inference.get_initial_live_points(
+        10, rstate=np.random.default_rng(42)
+    )
+    for array, same_array in zip(live_points, same_live_points):
+        np.testing.assert_array_equal(array, same_array)
+
+
+def test_pool_likelihood_does_not_pickle_inference(monkeypatch):
+    from sunbird.inference import nested
+
+    inference = get_inference(inference_class=Nested)
+    monkeypatch.setattr(nested, "_nested", inference)
+    loglikelihood = pickle.loads(pickle.dumps(nested._get_loglikelihood_for_params))
+    prior_transform = pickle.loads(pickle.dumps(nested._get_prior_from_cube))
+    params = prior_transform(np.array([0.2, 0.7]))
+    np.testing.assert_allclose(
+        params, inference.get_prior_from_cube(np.array([0.2, 0.7]))
+    )
+    assert loglikelihood(params) == inference.get_loglikelihood_for_params(params)
+
+
+@pytest.mark.parametrize("diagonal", [False, True])
+def test_loglikelihood_for_tensor_prediction(diagonal):
+    inference = get_inference(diagonal=diagonal)
+    prediction, _ = inference.get_model_prediction(np.array([0.2, 0.7]))
+    assert isinstance(prediction, torch.Tensor)
+    expected = get_expected_loglikelihood(
+        inference, np.asarray(prediction, dtype=np.float64)
+    )
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_prediction(prediction), expected, rtol=1.0e-6
+    )
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_prediction_vectorized(prediction[None]),
+        [expected],
+        rtol=1.0e-6,
+    )
+
+
+def assert_loglikelihood_is_expected(inference, parameters):
+    prediction, predicted_uncertainty = inference.get_model_prediction_vectorized(
+        parameters
+    )
+    prediction = np.asarray(prediction, dtype=np.float64)
+    if inference.add_predicted_uncertainty:
+        predicted_uncertainty = np.asarray(predicted_uncertainty, dtype=np.float64)
+    else:
+        predicted_uncertainty = None
+    expected, loglikelihood = [], []
+    for i, p in enumerate(prediction):
+        u = None if predicted_uncertainty is None else predicted_uncertainty[i]
+        expected.append(get_expected_loglikelihood(inference, p, u))
+        loglikelihood.append(inference.get_loglikelihood_for_prediction(p, u))
+    np.testing.assert_allclose(loglikelihood, expected, rtol=1.0e-6)
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_prediction_vectorized(
+            prediction, predicted_uncertainty
+        ),
+        expected,
+        rtol=1.0e-6,
+    )
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_batch(parameters), expected, rtol=1.0e-6
+    )
+
+
+def test_loglikelihood():
+    inference = get_inference()
+    parameters = np.random.default_rng(1).random(size=(5, 2))
+    assert_loglikelihood_is_expected(inference, parameters)
+
+
+@pytest.mark.parametrize("add_predicted_uncertainty", [False, True])
+def test_loglikelihood_diagonal(add_predicted_uncertainty):
+    inference = get_inference(
+        diagonal=True, add_predicted_uncertainty=add_predicted_uncertainty
+    )
+    assert inference.diagonal_covariance
+    parameters = np.random.default_rng(1).random(size=(5, 2))
+    assert_loglikelihood_is_expected(inference, parameters)
+
+
+@pytest.mark.parametrize("uncertainty_scale", [1.0e-4, 1.0])
+def test_loglikelihood_with_predicted_uncertainty(uncertainty_scale):
+    inference = get_inference(
+        add_predicted_uncertainty=True, uncertainty_scale=uncertainty_scale
+    )
+    parameters = np.random.default_rng(1).random(size=(5, 2))
+    assert_loglikelihood_is_expected(inference, parameters)
+
+
+def test_predicted_uncertainty_path_is_chosen_per_sample():
+    inference = get_inference(add_predicted_uncertainty=True)
+    rng = np.random.default_rng(1)
+    prediction = inference.observation + rng.normal(size=(4, 20))
+    threshold = np.sqrt(
+        sunbird.inference.inference.PREDICTED_UNCERTAINTY_RTOL
+        * inference.covariance_eigenvalues[0]
+    )
+    predicted_uncertainty = np.outer([0.5, 0.99, 1.01, 10.0], threshold * np.ones(20))
+    loglikelihood = [
+        inference.get_loglikelihood_for_prediction(p, u)
+        for p, u in zip(prediction, predicted_uncertainty)
+    ]
+    np.testing.assert_array_equal(
+        inference.get_loglikelihood_for_prediction_vectorized(
+            prediction, predicted_uncertainty
+        ),
+        loglikelihood,
+    )
+    expected = [
+        get_expected_loglikelihood(inference, p, u)
+        for p, u in zip(prediction, predicted_uncertainty)
+    ]
+    np.testing.assert_allclose(loglikelihood, expected, rtol=1.0e-6)
+
+
+def test_loglikelihood_numba_and_fallback(monkeypatch):
+    pytest.importorskip("numba")
+    inference = get_inference()
+    prediction, _ = inference.get_model_prediction_vectorized(
+        np.random.default_rng(1).random(size=(5, 2))
+    )
+    loglikelihood_numba = [
+        inference.get_loglikelihood_for_prediction(p) for p in prediction
+    ]
+    monkeypatch.setattr(sunbird.inference.inference, "NUMBA_AVAILABLE", False)
+    loglikelihood_fallback = [
+        inference.get_loglikelihood_for_prediction(p) for p in prediction
+    ]
+    np.testing.assert_allclose(
+        loglikelihood_numba, loglikelihood_fallback, rtol=1.0e-10
+    )
+
+
+class CachedInference(FixedInference):
+    covariance_calls = 0
+
+    @classmethod
+    def get_observation_and_parameters(cls, obs_config, **kwargs):
+        return np.random.default_rng(0).normal(size=20), {"c": 0.5}
+
+    @classmethod
+    def get_theory_model(cls, theory_config, statistics, device="cpu"):
+        return get_summary(20)
+
+    @classmethod
+    def get_covariance_matrix(cls, **kwargs):
+        cls.covariance_calls += 1
+        return get_inference().covariance_matrix
+
+
+def test_covariance_cache(tmp_path):
+    config = {
+        "statistics": ["linear"],
+        "select_filters": None,
+        "slice_filters": None,
+        "fixed_parameters": ["c"],
+        "theory_model": {"module": "tests", "class": "LinearEmulator"},
+        "priors": {
+            "stats_module": "scipy.stats",
+            "a": {"distribution": "uniform", "min": 0.0, "max": 1.0},
+            "b": {"distribution": "uniform", "min": 0.0, "max": 1.0},
+        },
+        "data": {
+            "observation": {},
+            "covariance": {
+                "class": "Linear",
+                "dataset": "linear",
+                "add_emulator_error_test_set": False,
+                "add_simulation_error": False,
+                "add_predicted_uncertainty": False,
+                "volume_scaling": 1.0,
+                "cache_dir": str(tmp_path),
+            },
+        },
+        "inference": {"output_dir": str(tmp_path / "chains")},
+    }
+    inference = CachedInference.from_config_dict(config)
+    cached_inference = CachedInference.from_config_dict(config)
+    assert CachedInference.covariance_calls == 1
+    np.testing.assert_allclose(
+        cached_inference.cholesky_factor, inference.cholesky_factor
+    )
+    np.testing.assert_allclose(
+        cached_inference.covariance_matrix, inference.covariance_matrix, rtol=1.0e-10
+    )
+    parameters = np.random.default_rng(1).random(size=(5, 2))
+    np.testing.assert_allclose(
+        cached_inference.get_loglikelihood_for_batch(parameters),
+        inference.get_loglikelihood_for_batch(parameters),
+        rtol=1.0e-10,
+    )
+
+
+@pytest.mark.parametrize("diagonal", [False, True])
+@pytest.mark.parametrize("add_predicted_uncertainty", [False, True])
+def test_rescale_covariance(diagonal, add_predicted_uncertainty):
+    inference = get_inference(
+        diagonal=diagonal, add_predicted_uncertainty=add_predicted_uncertainty
+    )
+    inference.rescale_covariance(2.5)
+    expected_inference = get_inference(
+        diagonal=diagonal,
+        add_predicted_uncertainty=add_predicted_uncertainty,
+        covariance_scale=2.5,
+    )
+    parameters = np.random.default_rng(1).random(size=(5, 2))
+    prediction, predicted_uncertainty = inference.get_model_prediction_vectorized(
+        parameters
+    )
+    prediction = np.asarray(prediction, dtype=np.float64)
+    predicted_uncertainty = np.asarray(predicted_uncertainty, dtype=np.float64)
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_prediction_vectorized(
+            prediction, predicted_uncertainty
+        ),
+        expected_inference.get_loglikelihood_for_prediction_vectorized(
+            prediction, predicted_uncertainty
+        ),
+        rtol=1.0e-10,
+    )
+    np.testing.assert_allclose(
+        inference.get_loglikelihood_for_batch(parameters),
+        expected_inference.get_loglikelihood_for_batch(parameters),
+        rtol=1.0e-10,
+    )
+
+
+def test_sample_from_prior_vectorized():
+    inference = get_inference()
+    params = inference.sample_parameters_from_prior_vectorized(7)
+    assert set(params) == {"a", "b", "c"}
+    for param in ("a", "b"):
+        assert params[param].shape == (7,)
+        assert np.all((params[param] >= 0.0) & (params[param] <= 1.0))
+    np.testing.assert_array_equal(params["c"], np.full(7, 0.5))
+    params, (prediction, predicted_uncertainty) = (
+        inference.sample_from_prior_vectorized(7)
+    )
+    assert prediction.shape == (7, 20)
+    assert predicted_uncertainty.shape == (7, 20)
+    expected_prediction, expected_uncertainty = (
+        inference.get_model_prediction_vectorized(
+            np.stack([params["a"], params["b"]], axis=-1)
+        )
+    )
+    np.testing.assert_allclose(prediction, expected_prediction)
+    np.testing.assert_allclose(predicted_uncertainty, expected_uncertainty)
 
 
 def test_observation():
@@ -222,6 +615,23 @@ def test_priors():
     assert priors['b'].rvs() < -0.02
 
 
+def test_priors_from_same_config():
+    prior_config = {
+        'stats_module': 'scipy.stats',
+        'a': {'distribution': 'uniform', 'min': 0.01, 'max': 0.02},
+        'b': {'distribution': 'norm', 'mean': 0., 'dispersion': 1.},
+    }
+    for _ in range(2):
+        priors = Nested.get_priors(
+            prior_config=prior_config,
+            parameters_to_fit=['a','b'],
+        )
+        assert priors['a'].ppf(0.) == pytest.approx(0.01)
+        assert priors['a'].ppf(1.) == pytest.approx(0.02)
+        assert priors['b'].std() == pytest.approx(1.)
+    assert prior_config['a'] == {'distribution': 'uniform', 'min': 0.01, 'max': 0.02}
+
+
 def test_get_theory_model():
     theory_model = Nested.get_theory_model(
         theory_config={